@@ -2,106 +2,154 @@ import argparse
 import json
 import csv
 import requests
+import os
+import shutil
+import time
+from datetime import datetime, timezone
 from azure.identity import DeviceCodeCredential
 
+# Shared session so every management request reuses pooled connections
+session = requests.Session()
+
+# Failed management API requests in the current cycle, reported in the summary and status file
+stats = {"RequestErrors": 0}
+
 def get_access_token(credential, scope):
     try:
         token = credential.get_token(scope)
         return token.token
     except Exception as e:
         print(f"Error getting access token: {e}")
-        exit(1)
+        raise
 
 def get_subscriptions(access_token):
     try:
         headers = {"Authorization": f"Bearer {access_token}"}
-        response = requests.get("https://management.azure.com/subscriptions?api-version=2014-04-01", headers=headers)
+        response = session.get("https://management.azure.com/subscriptions?api-version=2014-04-01", headers=headers)
         response.raise_for_status()
         return response.json()["value"]
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP error occurred while getting subscriptions: {http_err}")
+        stats["RequestErrors"] += 1
     except Exception as err:
         print(f"An error occurred while getting subscriptions: {err}")
+        stats["RequestErrors"] += 1
     return []
 
 def get_resource_groups(subscription_id, access_token):
     try:
         headers = {"Authorization": f"Bearer {access_token}"}
         url = f"https://management.azure.com/subscriptions/{subscription_id}/resourceGroups?api-version=2014-04-01"
-        response = requests.get(url, headers=headers)
+        response = session.get(url, headers=headers)
         response.raise_for_status()
         return response.json()["value"]
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP error occurred while getting resource groups for subscription {subscription_id}: {http_err}")
+        stats["RequestErrors"] += 1
     except Exception as err:
         print(f"An error occurred while getting resource groups for subscription {subscription_id}: {err}")
+        stats["RequestErrors"] += 1
     return []
 
 def get_key_vaults(subscription_id, resource_group_name, access_token):
     try:
         headers = {"Authorization": f"Bearer {access_token}"}
         url = f"https://management.azure.com/subscriptions/{subscription_id}/resourceGroups/{resource_group_name}/providers/Microsoft.KeyVault/vaults?api-version=2016-10-01"
-        response = requests.get(url, headers=headers)
+        response = session.get(url, headers=headers)
         response.raise_for_status()
         return response.json()["value"]
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP error occurred while getting key vaults for resource group {resource_group_name}: {http_err}")
+        stats["RequestErrors"] += 1
     except Exception as err:
         print(f"An error occurred while getting key vaults for resource group {resource_group_name}: {err}")
+        stats["RequestErrors"] += 1
     return []
 
 def get_secrets(subscription_id, resource_group_name, key_vault_name, access_token):
     try:
         headers = {"Authorization": f"Bearer {access_token}"}
         url = f"https://management.azure.com/subscriptions/{subscription_id}/resourceGroups/{resource_group_name}/providers/Microsoft.KeyVault/vaults/{key_vault_name}/secrets?api-version=2016-10-01"
-        response = requests.get(url, headers=headers)
+        response = session.get(url, headers=headers)
         response.raise_for_status()
         return response.json()["value"]
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP error occurred while getting secrets for key vault {key_vault_name}: {http_err}")
+        stats["RequestErrors"] += 1
     except Exception as err:
         print(f"An error occurred while getting secrets for key vault {key_vault_name}: {err}")
+        stats["RequestErrors"] += 1
     return []
 
-def main(args):
-    banner = r"""
-     _             ____  _                        _ _             
-    / \    ____   / ___|| | ___   ___      ____ _| | | _____ _ __ 
-   / _ \  |_  /___\___ \| |/ / | | \ \ /\ / / _` | | |/ / _ \ '__|
-  / ___ \  / /_____|__) |   <| |_| |\ V  V / (_| | |   <  __/ |   
- /_/   \_\/___|   |____/|_|\_\\__, | \_/\_/ \__,_|_|_|\_\___|_|   
-                              |___/
-    """
-    print(banner)
-    
-    credential = DeviceCodeCredential()
-    management_access_token = get_access_token(credential, "https://management.azure.com/.default")
-    
-    subscriptions = get_subscriptions(management_access_token)
+def write_status(status_file, status):
+    # Write to a temporary file first so readers never see a half-written status
+    tmp_file = f"{status_file}.tmp"
+    with open(tmp_file, "w") as status_out:
+        json.dump(status, status_out, indent=4)
+    os.replace(tmp_file, status_file)
+
+def append_json(json_path, new_items, started):
+    # Splice the new items in before the closing bracket instead of holding every finding in memory.
+    # The result matches json.dump(indent=4) of the whole list and replaces the file atomically.
+    tmp_file = f"{json_path}.tmp"
+    chunk = json.dumps(new_items, indent=4).encode("ascii")
+    if started:
+        shutil.copyfile(json_path, tmp_file)
+        with open(tmp_file, "r+b") as json_file:
+            json_file.seek(-2, os.SEEK_END)  # Trailing "\n]"
+            json_file.write(b",\n" + chunk[2:])
+    else:
+        with open(tmp_file, "wb") as json_file:
+            json_file.write(chunk)
+    os.replace(tmp_file, json_path)
+
+def write_outputs(args, state, new_secrets):
+    if args.json:
+        append_json("secrets.json", new_secrets, state["json_started"])
+        state["json_started"] = True
     
-    all_secrets = []
+    if args.csv:
+        with open("secrets.csv", "a" if state["csv_started"] else "w", newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=new_secrets[0].keys())
+            if not state["csv_started"]:
+                writer.writeheader()
+            writer.writerows(new_secrets)
+        state["csv_started"] = True
+
+def scan(args, access_token, state):
+    new_secrets = []
     subscription_count = 0
     resource_group_count = 0
     key_vault_count = 0
     secret_count = 0
     
+    stats["RequestErrors"] = 0
+    subscriptions = get_subscriptions(access_token)
+    if not subscriptions:
+        raise RuntimeError("No subscriptions could be retrieved.")
+    
     for subscription in subscriptions:
         subscription_id = subscription["subscriptionId"]
         subscription_count += 1
-        resource_groups = get_resource_groups(subscription_id, management_access_token)
+        resource_groups = get_resource_groups(subscription_id, access_token)
         
         for resource_group in resource_groups:
             resource_group_name = resource_group["name"]
             resource_group_count += 1
-            key_vaults = get_key_vaults(subscription_id, resource_group_name, management_access_token)
+            key_vaults = get_key_vaults(subscription_id, resource_group_name, access_token)
             
             for key_vault in key_vaults:
                 key_vault_name = key_vault["name"]
                 key_vault_count += 1
-                secrets = get_secrets(subscription_id, resource_group_name, key_vault_name, management_access_token)
+                secrets = get_secrets(subscription_id, resource_group_name, key_vault_name, access_token)
                 
                 for secret in secrets:
                     secret_count += 1
+                    
+                    # A secret is only reported again when a new version appears
+                    if secret["properties"]["secretUriWithVersion"] in state["seen_secrets"]:
+                        continue
+                    
                     secret_details = {
                         "SubscriptionId": subscription_id,
                         "ResourceGroupName": resource_group_name,
@@ -117,39 +165,110 @@ def main(args):
                         "SecretUriWithVersion": secret["properties"]["secretUriWithVersion"]
                     }
                     
-                    all_secrets.append(secret_details)
+                    state["seen_secrets"].add(secret_details["SecretUriWithVersion"])
+                    new_secrets.append(secret_details)
                     if not args.noDisplay:
                         print(secret_details)
     
-    if args.json and all_secrets:
-        with open("secrets.json", "w") as json_file:
-            json.dump(all_secrets, json_file, indent=4)
-    elif args.json:
-        print("No secrets found. Skipping JSON generation.")
-    
-    if args.csv and all_secrets:
-        with open("secrets.csv", "w", newline='') as csv_file:
-            writer = csv.DictWriter(csv_file, fieldnames=all_secrets[0].keys())
-            writer.writeheader()
-            writer.writerows(all_secrets)
-    elif args.csv:
-        print("No secrets found. Skipping CSV generation.")
-    
     summary = {
         "TotalSecrets": secret_count,
         "TotalKeyVaults": key_vault_count,
         "TotalResourceGroups": resource_group_count,
-        "TotalSubscriptions": subscription_count
+        "TotalSubscriptions": subscription_count,
+        "RequestErrors": stats["RequestErrors"]
     }
     
-    print("\nSummary:")
-    for key, value in summary.items():
-        print(f"{key}: {value}")
+    return new_secrets, summary
+
+def main(args):
+    banner = r"""
+     _             ____  _                        _ _             
+    / \    ____   / ___|| | ___   ___      ____ _| | | _____ _ __ 
+   / _ \  |_  /___\___ \| |/ / | | \ \ /\ / / _` | | |/ / _ \ '__|
+  / ___ \  / /_____|__) |   <| |_| |\ V  V / (_| | |   <  __/ |   
+ /_/   \_\/___|   |____/|_|\_\\__, | \_/\_/ \__,_|_|_|\_\___|_|   
+                              |___/
+    """
+    print(banner)
+    
+    credential = DeviceCodeCredential()
+    
+    # Inventory kept in memory across watch cycles
+    state = {
+        "seen_secrets": set(),
+        "total_secrets": 0,
+        "json_started": False,
+        "csv_started": False
+    }
+    cycle = 0
+    
+    try:
+        while True:
+            cycle += 1
+            cycle_start = time.monotonic()
+            started_at = datetime.now(timezone.utc).isoformat()
+            
+            try:
+                # The credential caches the token and only goes back to Entra ID when it is close to expiry
+                management_access_token = get_access_token(credential, "https://management.azure.com/.default")
+                
+                new_secrets, summary = scan(args, management_access_token, state)
+                
+                if new_secrets:
+                    state["total_secrets"] += len(new_secrets)
+                    write_outputs(args, state, new_secrets)
+                elif cycle == 1:
+                    if args.json:
+                        print("No secrets found. Skipping JSON generation.")
+                    if args.csv:
+                        print("No secrets found. Skipping CSV generation.")
+                else:
+                    print("No new secrets found.")
+                
+                summary["NewSecrets"] = len(new_secrets)
+                summary["TotalReportedSecrets"] = state["total_secrets"]
+                
+                print("\nSummary:")
+                for key, value in summary.items():
+                    print(f"{key}: {value}")
+            except Exception as err:
+                # A single failed cycle must not take down watch mode
+                print(f"An error occurred during scan cycle {cycle}: {err}")
+                summary = {"Error": str(err)}
+            
+            elapsed = time.monotonic() - cycle_start
+            
+            try:
+                write_status(args.status_file, {
+                    "Cycle": cycle,
+                    "LastCycleStarted": started_at,
+                    "LastCycleSeconds": round(elapsed, 3),
+                    "IntervalSeconds": args.watch,
+                    **summary
+                })
+            except OSError as err:
+                print(f"An error occurred while writing status file {args.status_file}: {err}")
+            
+            if not args.watch:
+                if "Error" in summary:
+                    exit(1)
+                break
+            
+            # Cycles start every N seconds; a cycle that overruns is followed immediately by the next
+            wait = max(0, args.watch - elapsed)
+            print(f"\nWaiting {round(wait)} seconds before the next cycle...")
+            time.sleep(wait)
+    except KeyboardInterrupt:
+        print("\nExiting...")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Enumerates all secrets in all Key Vaults in all subscriptions using the Azure Management API.")
     parser.add_argument("-json", action="store_true", help="Output results to a JSON file.")
     parser.add_argument("-csv", action="store_true", help="Output results to a CSV file.")
     parser.add_argument("-noDisplay", action="store_true", help="Do not display the secrets on screen but still respect the json and csv options.")
+    parser.add_argument("-watch", type=int, help="Stay resident and poll for new vaults and secrets every N seconds.")
+    parser.add_argument("-status_file", default="secrets_status.json", help="File the last scan cycle latency and counts are written to.")
     args = parser.parse_args()
+    if args.watch is not None and args.watch <= 0:
+        parser.error("-watch must be a positive number of seconds.")
     main(args)
@@ -6,6 +6,16 @@ from urllib.parse import quote, urlsplit, urlunsplit
 from azure.identity import DeviceCodeCredential
 import gzip
 import io
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+
+# Shared session so every management and link request reuses pooled connections
+session = requests.Session()
+
+# Failed management API requests in the current cycle, reported in the summary and status file
+stats = {"RequestErrors": 0}
 
 def get_access_token(credential, scope):
     try:
@@ -13,58 +23,85 @@ def get_access_token(credential, scope):
         return token.token
     except Exception as e:
         print(f"Error getting access token: {e}")
-        exit(1)
+        raise
 
 def get_subscriptions(access_token):
     try:
         headers = {"Authorization": f"Bearer {access_token}"}
-        response = requests.get("https://management.azure.com/subscriptions?api-version=2014-04-01", headers=headers)
+        response = session.get("https://management.azure.com/subscriptions?api-version=2014-04-01", headers=headers)
         response.raise_for_status()
         return response.json()["value"]
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP error occurred while getting subscriptions: {http_err}")
+        stats["RequestErrors"] += 1
     except Exception as err:
         print(f"An error occurred while getting subscriptions: {err}")
+        stats["RequestErrors"] += 1
     return []
 
 def get_logic_apps(subscription_id, access_token):
     try:
         headers = {"Authorization": f"Bearer {access_token}"}
         url = f"https://management.azure.com/subscriptions/{quote(subscription_id)}/providers/Microsoft.Logic/workflows?api-version=2016-06-01"
-        response = requests.get(url, headers=headers)
+        response = session.get(url, headers=headers)
         response.raise_for_status()
         return response.json()["value"]
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP error occurred while getting logic apps for subscription {subscription_id}: {http_err}")
+        stats["RequestErrors"] += 1
     except Exception as err:
         print(f"An error occurred while getting logic apps for subscription {subscription_id}: {err}")
+        stats["RequestErrors"] += 1
     return []
 
 def get_logic_app_definition(subscription_id, resource_group_name, logic_app_name, access_token):
     try:
         headers = {"Authorization": f"Bearer {access_token}"}
         url = f"https://management.azure.com/subscriptions/{quote(subscription_id)}/resourceGroups/{quote(resource_group_name)}/providers/Microsoft.Logic/workflows/{quote(logic_app_name)}?api-version=2016-06-01"
-        response = requests.get(url, headers=headers)
+        response = session.get(url, headers=headers)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP error occurred while getting logic app definition for {logic_app_name}: {http_err}")
+        stats["RequestErrors"] += 1
     except Exception as err:
         print(f"An error occurred while getting logic app definition for {logic_app_name}: {err}")
+        stats["RequestErrors"] += 1
     return {}
 
-def get_run_history(subscription_id, resource_group_name, logic_app_name, access_token):
+def get_run_history(subscription_id, resource_group_name, logic_app_name, access_token, next_link=None):
+    # Returns one page of runs, newest first, and the link to the next (older) page
     try:
         headers = {"Authorization": f"Bearer {access_token}"}
-        url = f"https://management.azure.com/subscriptions/{quote(subscription_id)}/resourceGroups/{quote(resource_group_name)}/providers/Microsoft.Logic/workflows/{quote(logic_app_name)}/runs?api-version=2016-06-01"
-        response = requests.get(url, headers=headers)
+        url = next_link or f"https://management.azure.com/subscriptions/{quote(subscription_id)}/resourceGroups/{quote(resource_group_name)}/providers/Microsoft.Logic/workflows/{quote(logic_app_name)}/runs?api-version=2016-06-01"
+        response = session.get(url, headers=headers)
         response.raise_for_status()
-        return response.json()["value"]
+        page = response.json()
+        return page["value"], page.get("nextLink")
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP error occurred while getting run history for {logic_app_name}: {http_err}")
+        stats["RequestErrors"] += 1
     except Exception as err:
         print(f"An error occurred while getting run history for {logic_app_name}: {err}")
-    return []
+        stats["RequestErrors"] += 1
+    # None rather than [] so a failed fetch is not mistaken for a workflow without runs
+    return None, None
+
+def get_run_actions(subscription_id, resource_group_name, logic_app_name, run_id, access_token):
+    try:
+        headers = {"Authorization": f"Bearer {access_token}"}
+        url = f"https://management.azure.com/subscriptions/{quote(subscription_id)}/resourceGroups/{quote(resource_group_name)}/providers/Microsoft.Logic/workflows/{quote(logic_app_name)}/runs/{quote(run_id)}/actions?api-version=2016-06-01"
+        response = session.get(url, headers=headers)
+        response.raise_for_status()
+        return response.json()["value"]
+    except requests.exceptions.HTTPError as http_err:
+        print(f"HTTP error occurred while getting actions for run {run_id}: {http_err}")
+        stats["RequestErrors"] += 1
+    except Exception as err:
+        print(f"An error occurred while getting actions for run {run_id}: {err}")
+        stats["RequestErrors"] += 1
+    # None rather than [] so the run is not mistaken for one without actions and retried next cycle
+    return None
 
 def extract_key_vault_info(logic_app_definition):
     key_vault_info = []
@@ -109,14 +146,16 @@ def get_action_details(subscription_id, resource_group_name, logic_app_name, run
         # URL encode the entire URL
         url = f"https://management.azure.com/subscriptions/{quote(subscription_id)}/resourceGroups/{quote(resource_group_name)}/providers/Microsoft.Logic/workflows/{quote(logic_app_name)}/runs/{quote(run_id)}/actions/{quote(action_name)}?api-version=2016-06-01"
         
-        response = requests.get(url, headers=headers)
+        response = session.get(url, headers=headers)
         response.raise_for_status()
         
         return response.json()
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP error occurred while getting action details for {action_name}: {http_err}")
+        stats["RequestErrors"] += 1
     except Exception as err:
         print(f"An error occurred while getting action details for {action_name}: {err}")
+        stats["RequestErrors"] += 1
     
     return {}
 
@@ -125,7 +164,7 @@ def get_link_body(link):
         headers = {
             "Accept": "application/json"
         }
-        response = requests.get(link, headers=headers)
+        response = session.get(link, headers=headers)
         response.raise_for_status()
               
         content_encoding = response.headers.get('Content-Encoding')
@@ -148,30 +187,60 @@ def get_link_body(link):
         print(f"An error occurred while getting link body: {err}")
         return {"error": str(err)}
 
-def main(args):
-    banner = r"""
-     _             ____  _                        _ _             
-    / \    ____   / ___|| | ___   ___      ____ _| | | _____ _ __ 
-   / _ \  |_  /___\___ \| |/ / | | \ \ /\ / / _` | | |/ / _ \ '__|
-  / ___ \  / /_____|__) |   <| |_| |\ V  V / (_| | |   <  __/ |   
- /_/   \_\/___|   |____/|_|\_\\__, | \_/\_/ \__,_|_|_|\_\___|_|   
-                              |___/
-    """
-    print(banner)
-    credential = DeviceCodeCredential()
+def write_status(status_file, status):
+    # Write to a temporary file first so readers never see a half-written status
+    tmp_file = f"{status_file}.tmp"
+    with open(tmp_file, "w") as status_out:
+        json.dump(status, status_out, indent=4)
+    os.replace(tmp_file, status_file)
 
-    access_token = get_access_token(credential, "https://management.azure.com/.default")
-    
-    subscriptions = get_subscriptions(access_token)
+def append_json(json_path, new_items, started):
+    # Splice the new items in before the closing bracket instead of holding every finding in memory.
+    # The result matches json.dump(indent=4) of the whole list and replaces the file atomically.
+    tmp_file = f"{json_path}.tmp"
+    chunk = json.dumps(new_items, indent=4).encode("ascii")
+    if started:
+        shutil.copyfile(json_path, tmp_file)
+        with open(tmp_file, "r+b") as json_file:
+            json_file.seek(-2, os.SEEK_END)  # Trailing "\n]"
+            json_file.write(b",\n" + chunk[2:])
+    else:
+        with open(tmp_file, "wb") as json_file:
+            json_file.write(chunk)
+    os.replace(tmp_file, json_path)
+
+def write_outputs(args, state, new_logic_apps):
+    if args.json:
+        append_json("logic_apps.json", new_logic_apps, state["json_started"])
+        state["json_started"] = True
     
-    all_logic_apps = []
+    if args.csv:
+        fieldnames = ["SubscriptionId", "ResourceGroupName", "LogicAppName", "KeyVaultInfo", "KeyVaultSecretActions", "InputsLink", "OutputsLink", "InputBody", "OutputBody", "EndTime"]
+        with open("logic_apps.csv", "a" if state["csv_started"] else "w", newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+            if not state["csv_started"]:
+                writer.writeheader()
+            writer.writerows(new_logic_apps)
+        state["csv_started"] = True
+
+# Run states in which more actions can still complete; every other state is final
+ACTIVE_RUN_STATES = ["Running", "Waiting", "Paused", "Suspended", "NotSpecified"]
+
+def scan(args, access_token, state):
+    new_logic_apps = []
     subscription_count = 0
     logic_app_count = 0
+    run_count = 0
     input_links_retrieved = 0
     output_links_retrieved = 0
     input_links_errors = 0
     output_links_errors = 0
     
+    stats["RequestErrors"] = 0
+    subscriptions = get_subscriptions(access_token)
+    if not subscriptions:
+        raise RuntimeError("No subscriptions could be retrieved.")
+    
     for subscription in subscriptions:
         subscription_id = subscription["subscriptionId"]
         
@@ -184,16 +253,52 @@ def main(args):
         for logic_app in logic_apps:
             logic_app_name = logic_app["name"]
             resource_group_name = logic_app["id"].split("/")[4]  # Extract resource group name from the ID
+            changed_time = logic_app.get("properties", {}).get("changedTime")
             
             if args.loglevel in ["info", "verbose"]:
                 print(f"Scanning logic app: {logic_app_name} in resource group: {resource_group_name}")
             
             logic_app_count += 1
-            logic_app_definition = get_logic_app_definition(subscription_id, resource_group_name, logic_app_name, access_token)
-            run_history = get_run_history(subscription_id, resource_group_name, logic_app_name, access_token)
             
-            if not args.all_history and run_history:
-                run_history = [run_history[0]]  # Only process the most recent run
+            # Only re-fetch the definition when the workflow changed since the last cycle
+            cached = state["definitions"].get(logic_app["id"])
+            if cached and changed_time and cached["ChangedTime"] == changed_time:
+                logic_app_definition = cached["Definition"]
+            else:
+                logic_app_definition = get_logic_app_definition(subscription_id, resource_group_name, logic_app_name, access_token)
+                # A failed fetch returns {}, which must not hide the definition until the workflow changes again
+                if logic_app_definition:
+                    state["definitions"][logic_app["id"]] = {"ChangedTime": changed_time, "Definition": logic_app_definition}
+            
+            run_history, next_link = get_run_history(subscription_id, resource_group_name, logic_app_name, access_token)
+            if run_history is None:
+                continue
+            
+            open_runs = state["open_runs"].setdefault(logic_app["id"], {})
+            
+            if logic_app["id"] not in state["baselined_workflows"]:
+                state["baselined_workflows"].add(logic_app["id"])
+                if not args.all_history and run_history:
+                    # Only process the most recent run; older runs form the baseline for watch mode
+                    state["seen_runs"].update(run["id"] for run in run_history[1:])
+                    run_history = [run_history[0]]
+            else:
+                # Follow older pages until reaching a run already seen and every run still in progress
+                history_complete = True
+                while True:
+                    run_ids = {run["id"] for run in run_history}
+                    if not next_link or (run_ids & state["seen_runs"] and run_ids.issuperset(open_runs)):
+                        break
+                    page, next_link = get_run_history(subscription_id, resource_group_name, logic_app_name, access_token, next_link)
+                    if page is None:
+                        history_complete = False
+                        break
+                    run_history += page
+                
+                # Runs in progress that dropped off the history will never be listed again
+                if history_complete:
+                    for run_id in set(open_runs) - {run["id"] for run in run_history}:
+                        del open_runs[run_id]
             
             key_vault_info = extract_key_vault_info(logic_app_definition)
             secret_actions = extract_secret_actions(logic_app_definition)
@@ -201,19 +306,27 @@ def main(args):
             for run in run_history:
                 run_id = run["name"]
                 
+                # Finished runs already processed in a previous cycle have nothing new to report.
+                # Older runs are still checked, as they may have been in progress earlier.
+                if run["id"] in state["seen_runs"]:
+                    continue
+                
                 if args.loglevel in ["info", "verbose"]:
                     print(f"Scanning run_id: {run_id}")
                 
-                actions_url = f"https://management.azure.com/subscriptions/{quote(subscription_id)}/resourceGroups/{quote(resource_group_name)}/providers/Microsoft.Logic/workflows/{quote(logic_app_name)}/runs/{quote(run_id)}/actions?api-version=2016-06-01"
-                actions_response = requests.get(actions_url, headers={"Authorization": f"Bearer {access_token}"})
-                actions_response.raise_for_status()
-                actions = actions_response.json()["value"]
+                actions = get_run_actions(subscription_id, resource_group_name, logic_app_name, run_id, access_token)
+                if actions is None:
+                    continue
+                
+                run_count += 1
+                # Actions already reported while the run was still in progress
+                reported_actions = open_runs.setdefault(run["id"], set())
                 
                 for action in actions:
                     action_name = action["name"]
                     action_status = action["properties"]["status"]
                     
-                    if action_status != "Succeeded":
+                    if action_status != "Succeeded" or action_name in reported_actions:
                         continue
                     
                     if args.loglevel in ["info", "verbose"]:
@@ -253,37 +366,110 @@ def main(args):
                         "EndTime": end_time
                     }
                     
-                    all_logic_apps.append(logic_app_details)
+                    new_logic_apps.append(logic_app_details)
+                    reported_actions.add(action_name)
                     
                     if args.loglevel == "verbose":
                         print(logic_app_details)
-    
-    if all_logic_apps:
-        if args.json:
-            with open("logic_apps.json", "w") as json_file:
-                json.dump(all_logic_apps, json_file, indent=4)
-        
-        if args.csv:
-            with open("logic_apps.csv", "w", newline='') as csv_file:
-                fieldnames = ["SubscriptionId", "ResourceGroupName", "LogicAppName", "KeyVaultInfo", "KeyVaultSecretActions", "InputsLink", "OutputsLink", "InputBody", "OutputBody", "EndTime"]
-                writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(all_logic_apps)
-    else:
-        print("No Logic Apps found with the specified criteria.")
+                
+                # Keep revisiting the run until no more of its actions can complete
+                if run.get("properties", {}).get("status") not in ACTIVE_RUN_STATES:
+                    open_runs.pop(run["id"], None)
+                    state["seen_runs"].add(run["id"])
     
     summary = {
         "TotalLogicApps": logic_app_count,
         "TotalSubscriptions": subscription_count,
+        "RunsScanned": run_count,
         "InputLinksRetrieved": input_links_retrieved,
         "OutputLinksRetrieved": output_links_retrieved,
         "InputLinksErrors": input_links_errors,
-        "OutputLinksErrors": output_links_errors
+        "OutputLinksErrors": output_links_errors,
+        "RequestErrors": stats["RequestErrors"]
     }
     
-    print("\nSummary:")
-    for key, value in summary.items():
-        print(f"{key}: {value}")
+    return new_logic_apps, summary
+
+def main(args):
+    banner = r"""
+     _             ____  _                        _ _             
+    / \    ____   / ___|| | ___   ___      ____ _| | | _____ _ __ 
+   / _ \  |_  /___\___ \| |/ / | | \ \ /\ / / _` | | |/ / _ \ '__|
+  / ___ \  / /_____|__) |   <| |_| |\ V  V / (_| | |   <  __/ |   
+ /_/   \_\/___|   |____/|_|\_\\__, | \_/\_/ \__,_|_|_|\_\___|_|   
+                              |___/
+    """
+    print(banner)
+    credential = DeviceCodeCredential()
+    
+    # Inventory kept in memory across watch cycles
+    state = {
+        "seen_runs": set(),
+        "open_runs": {},
+        "baselined_workflows": set(),
+        "definitions": {},
+        "total_findings": 0,
+        "json_started": False,
+        "csv_started": False
+    }
+    cycle = 0
+    
+    try:
+        while True:
+            cycle += 1
+            cycle_start = time.monotonic()
+            started_at = datetime.now(timezone.utc).isoformat()
+            
+            try:
+                # The credential caches the token and only goes back to Entra ID when it is close to expiry
+                access_token = get_access_token(credential, "https://management.azure.com/.default")
+                
+                new_logic_apps, summary = scan(args, access_token, state)
+                
+                if new_logic_apps:
+                    state["total_findings"] += len(new_logic_apps)
+                    write_outputs(args, state, new_logic_apps)
+                elif cycle == 1:
+                    print("No Logic Apps found with the specified criteria.")
+                elif args.loglevel in ["info", "verbose"]:
+                    print("No new Logic App findings.")
+                
+                summary["NewFindings"] = len(new_logic_apps)
+                summary["TotalFindings"] = state["total_findings"]
+                
+                print("\nSummary:")
+                for key, value in summary.items():
+                    print(f"{key}: {value}")
+            except Exception as err:
+                # A single failed cycle must not take down watch mode
+                print(f"An error occurred during scan cycle {cycle}: {err}")
+                summary = {"Error": str(err)}
+            
+            elapsed = time.monotonic() - cycle_start
+            
+            try:
+                write_status(args.status_file, {
+                    "Cycle": cycle,
+                    "LastCycleStarted": started_at,
+                    "LastCycleSeconds": round(elapsed, 3),
+                    "IntervalSeconds": args.watch,
+                    **summary
+                })
+            except OSError as err:
+                print(f"An error occurred while writing status file {args.status_file}: {err}")
+            
+            if not args.watch:
+                if "Error" in summary:
+                    exit(1)
+                break
+            
+            # Cycles start every N seconds; a cycle that overruns is followed immediately by the next
+            wait = max(0, args.watch - elapsed)
+            if args.loglevel in ["info", "verbose"]:
+                print(f"\nWaiting {round(wait)} seconds before the next cycle...")
+            time.sleep(wait)
+    except KeyboardInterrupt:
+        print("\nExiting...")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Enumerates all Logic Apps in all resource groups in all subscriptions using the Azure Management API.")
@@ -292,5 +478,9 @@ if __name__ == "__main__":
     parser.add_argument("-loglevel", choices=["quiet", "info", "verbose"], default="info", help="Set the logging level.")
     parser.add_argument("-dump_secrets", action="store_true", help="Retrieve and output the body of inputsLink and outputsLink URLs.")
     parser.add_argument("-all_history", action="store_true", help="Process all runs of the workflow.")
+    parser.add_argument("-watch", type=int, help="Stay resident and poll for new workflows and runs every N seconds.")
+    parser.add_argument("-status_file", default="logic_apps_status.json", help="File the last scan cycle latency and counts are written to.")
     args = parser.parse_args()
+    if args.watch is not None and args.watch <= 0:
+        parser.error("-watch must be a positive number of seconds.")
     main(args)